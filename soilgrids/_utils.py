@@ -1,97 +1,321 @@
+import atexit
+import functools
+import hashlib
 import importlib.resources
+import json
 import logging
 import subprocess
+import tempfile
+import threading
 import time
+import urllib.parse
 import numpy as np
 import pandas as pd
 import os
 import shutil
 import glob
 import shlex
+from collections import deque
 
 _logger = logging.getLogger('soilgrids')
 
 def _check_arg(arg, name, allowed_vals):
     """Check that a function argument is either None or a subset of allowed_vals."""
     
-    if arg in [None, []]:
-        return allowed_vals
+    if arg is None or (isinstance(arg, (list, tuple)) and not arg):
+        return list(allowed_vals)
     
     if isinstance(arg, str):
         arg = [arg]
     
+    _check_arg_vals(tuple(arg), name, tuple(allowed_vals))
+    
+    return arg
+
+
+@functools.lru_cache(maxsize=128)
+def _check_arg_vals(arg, name, allowed_vals):
+    """Used by `_check_arg()`. Cached, since the same arguments tend to be 
+    checked over and over. NB, failures raise so are never cached."""
+    
     # Worth checking this before sending a request, both to avoid unnecessary
     # load on Soilgrids and to provide a quicker error with a more helpful
     # message in the event that an argument is invalid
-    assert set(arg) <= set(allowed_vals), \
+    invalid = set(arg).difference(allowed_vals)
+    assert not invalid, \
         "Invalid `{}`. \n  i: Check '{}'. \n  i: Allowed values are: '{}'.".format(
             name, 
-            "', '".join(set(arg) - set(allowed_vals)),
+            "', '".join(invalid),
             "', '".join(allowed_vals)
         )
-    
-    return arg
 
 
+_scalar_types = (str, int, float, bool, type(None))
+_vector_types = (list, tuple, np.ndarray, pd.Series)
+
 def _to_vector(x):
     """Convert a scalar to a vector, or leave a vector unchanged."""
-    scalars = [str, int, float, bool, type(None)]
-    vectors = [list, np.ndarray, pd.Series]
-    if any([isinstance(x, t) for t in scalars]):
+    if isinstance(x, _scalar_types):
         return [x]
-    if any([isinstance(x, t) for t in vectors]):
+    if isinstance(x, _vector_types):
         return x
     raise TypeError(f'Cannot convert {type(x)} to vector')
     
 
 
 class _Throttle():
-    """Sleep for a specified minimum interval between calls"""
+    """Sleep for a specified minimum interval between calls
     
-    def __init__(self, interval=5):
+    If `burst` is more than 1, up to `burst` calls may be made at once, so long
+    as there are never more than `burst` calls in any window of 
+    `interval * burst` seconds. This gives the same long-run rate, but means
+    small batches don't have to wait at all.
+    
+    Safe to call from multiple threads. Each call reserves the next free slot
+    while holding a lock and then sleeps until that slot without it, so 
+    waiting threads are released in turn rather than all at once.
+    """
+    
+    def __init__(self, interval=5, burst=1):
         self.interval = interval
-        self.last_request_time = None
+        self.burst = burst
+        # NB, these are the times callers will make their requests, which may 
+        # be in the future
+        self._call_times = deque(maxlen=burst)
+        self._lock = threading.Lock()
         
     def __call__(self):
-        if self.last_request_time is None:
-            self.last_request_time = time.time()
-            return
-        
-        time_since_last_request = time.time() - self.last_request_time
-        time_to_wait = self.interval - time_since_last_request
+        with self._lock:
+            now = time.monotonic()
+            if len(self._call_times) < self.burst:
+                time_to_wait = 0
+            else:
+                window_start = self._call_times[0] + self.interval * self.burst
+                time_to_wait = max(window_start - now, 0)
+            
+            self._call_times.append(now + time_to_wait)
         
         if time_to_wait > 0:
-            _logger.info(f'Waiting {time_to_wait:.1f}s before next request...')
+            _logger.info('Waiting %.1fs before next request...', time_to_wait)
             time.sleep(time_to_wait)
+
+
+class _ResponseCache():
+    """Store JSON responses on disk, keyed by the parameters used to get them"""
+    
+    def __init__(self, path, max_age=30 * 24 * 60 * 60):
+        self.path = os.path.expanduser(path)
+        self.max_age = max_age
+        os.makedirs(self.path, exist_ok=True)
+        
+    def get(self, key):
+        file = self._file(key)
+        
+        try:
+            if time.time() - os.path.getmtime(file) > self.max_age:
+                return None
+            with open(file, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            # Missing or corrupt entries are just treated as misses
+            return None
+        
+    def set(self, key, value):
+        file = self._file(key)
+        
+        # Write to a temporary file first so a half-written entry is never read
+        with open(file + '.tmp', 'w', encoding='utf-8') as f:
+            json.dump(value, f)
+        os.replace(file + '.tmp', file)
+        
+    def _file(self, key):
+        key = json.dumps(key, sort_keys=True).encode('utf-8')
+        return os.path.join(self.path, hashlib.sha256(key).hexdigest() + '.json')
+
+
+def _rscript(script, *args, data=None):
+    """Run `rscript script.R arg1 arg2 arg3...` and return the printed output.
+    
+    If given, `data` (a `pandas.DataFrame`) is written to the script's stdin
+    as CSV, which avoids building the whole CSV as a string first.
+    """ 
+    return ''.join(_rscript_lines(script, *args, data=data))
+
+
+def _rscript_lines(script, *args, data=None):
+    """Equivalent to `_rscript()`, but yield lines of output as R prints them.
+    
+    This lets callers start processing output while R is still running. The
+    script's exit status is only checked once all output has been consumed.
+    """
+    
+    # NB, stderr goes to a file rather than a pipe, since a pipe could fill up
+    # and block R while we're waiting on stdout
+    with tempfile.TemporaryFile() as stderr:
+        proc = subprocess.Popen(
+            [_find_rscript_binary(), _pkg_file(script), *args], 
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            stderr=stderr,
+            text=True,
+            encoding='utf-8'
+        )
+        
+        try:
+            try:
+                if data is not None:
+                    data.to_csv(proc.stdin, index=False, lineterminator='\n')
+                proc.stdin.close()
+            except BrokenPipeError:
+                # R has exited early, so the error will be reported below
+                pass
             
-        self.last_request_time = time.time()
+            yield from proc.stdout
+            proc.wait()
+        finally:
+            # Only happens if the caller stops iterating early
+            if proc.poll() is None:
+                proc.kill()
+                proc.wait()
+            proc.stdout.close()
+        
+        if proc.returncode != 0:
+            stderr.seek(0)
+            raise _rscript_error(
+                f'R script failed with exit code {proc.returncode}.', 
+                args, 
+                stderr.read().decode('utf-8', errors='replace')
+            )
+
 
+# Escapes backslashes and control characters so each argument prints on one line
+_escape_table = {
+    **{i: f'\\x{i:02x}' for i in range(32)},
+    ord('\t'): '\\t', ord('\n'): '\\n', ord('\r'): '\\r', ord('\\'): '\\\\'
+}
 
-def _rscript(script, *args):
-    """Run `rscript script.R arg1 arg2 arg3...` and return the printed output.""" 
-     
-    res = subprocess.run(
-        [_find_rscript_binary(), _pkg_file(script), *args], 
-        capture_output=True
+
+def _rscript_error(problem, args, r_error):
+    """Create an informative error for when an R script fails."""
+    
+    # NB, generators avoid building intermediate lists
+    args_escaped = (arg.translate(_escape_table) for arg in args)
+    args_bullets = (f'* Arg {i+1}: `{arg}`' for i, arg in enumerate(args_escaped))
+    args_pretty  = '\n     '.join(
+        arg if len(arg) <= 80 else arg[:77] + '...' for arg in args_bullets
     )
     
-    if res.returncode != 0:
-        args_escaped = [arg.encode('unicode_escape').decode('utf-8') for arg in args]
-        args_bullets = [f'* Arg {i+1}: `{arg}`' for i, arg in enumerate(args_escaped)]
-        args_trunc   = [arg if len(arg) <= 80 else arg[:77] + '...' for arg in args_bullets]
-        args_pretty  = '\n     '.join(args_trunc)
+    return RuntimeError(
+        f'{problem}\n' \
+        f'  i: Check the arguments:\n' \
+        f'     {args_pretty}\n' \
+        f'  i: Check the error returned by R: \n' \
+        f'     {r_error}.'
+    )
+
+
+class _RWorker():
+    """Run R scripts using a single long-lived R process.
+    
+    Starting R can take a good fraction of a second, so for repeated calls it's
+    much quicker to keep one R process running in the background and send it
+    scripts to run. The process is started on first use. See 
+    `r-scripts/worker.R` for the other side of the exchange.
+    """
+    
+    # Marks the end of a request to R, and of R's response
+    _sentinel = '\\.'
+    
+    def __init__(self):
+        self._proc = None
+        self._stderr = None
+        self._lock = threading.Lock()
+        
+    def __call__(self, script, *args, data=None):
+        """Equivalent to `_rscript()`, but without the cost of starting R."""
         
-        raise RuntimeError(
-            f'R script failed with exit code {res.returncode}.\n' \
-            f'  i: Check the arguments:\n' \
-            f'     {args_pretty}\n' \
-            f'  i: Check the error returned by R: \n' \
-            f'     {res.stderr.decode("utf-8")}.'
+        # Only one script can run at a time, since they share the same pipes
+        with self._lock:
+            if self._proc is None or self._proc.poll() is not None:
+                self.shutdown()
+                self._start()
+            
+            try:
+                self._send(script, args, data)
+                output, status = self._receive()
+            except (BrokenPipeError, EOFError) as exc:
+                raise _rscript_error(
+                    'The R worker process exited unexpectedly.', 
+                    args, 
+                    self.shutdown().strip()
+                ) from exc
+            
+        if status != 'OK':
+            raise _rscript_error('R script failed.', args, '\n'.join(output))
+            
+        return '\n'.join(output)
+    
+    def shutdown(self):
+        """Stop the R process, if it's running, returning anything it wrote to
+        stderr."""
+        if self._proc is None:
+            return ''
+        
+        # Closing stdin tells the worker to exit
+        try:
+            self._proc.stdin.close()
+        except BrokenPipeError:
+            # The worker has already exited
+            pass
+        self._proc.wait()
+        
+        self._stderr.seek(0)
+        stderr = self._stderr.read().decode('utf-8', errors='replace')
+        self._stderr.close()
+        
+        self._proc = self._stderr = None
+        return stderr
+    
+    def _start(self):
+        # NB, as in `_rscript_lines()`, stderr goes to a file rather than a 
+        # pipe, so that R can't block on a full pipe. It's read if the worker
+        # dies, so the reason can be reported.
+        self._stderr = tempfile.TemporaryFile()
+        self._proc = subprocess.Popen(
+            [_find_rscript_binary(), _pkg_file('r-scripts/worker.R')],
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            stderr=self._stderr,
+            text=True,
+            encoding='utf-8'
         )
     
-    return res.stdout.decode('utf-8')
+    def _send(self, script, args, data):
+        stdin = self._proc.stdin
+        stdin.write(urllib.parse.quote(_pkg_file(script), safe='') + '\n')
+        stdin.write(f'{len(args)}\n')
+        for arg in args:
+            stdin.write(urllib.parse.quote(arg, safe='') + '\n')
+        if data is not None:
+            data.to_csv(stdin, index=False, lineterminator='\n')
+        stdin.write(self._sentinel + '\n')
+        stdin.flush()
+    
+    def _receive(self):
+        output = []
+        for line in self._proc.stdout:
+            line = line.rstrip('\n')
+            if line.startswith(self._sentinel + ' '):
+                return output, line[len(self._sentinel) + 1:]
+            output.append(line)
+        raise EOFError('No response from R')
+
 
+_r_worker = _RWorker()
+atexit.register(_r_worker.shutdown)
 
+
+@functools.lru_cache(maxsize=1)
 def _find_rscript_binary():
     """Attempt to find the binary for Rscript.
 
@@ -101,6 +325,9 @@ def _find_rscript_binary():
     fiddling with their system variables. NB, the design of this function was 
     influenced by some research into how RStudio finds the R executable, since 
     it does so quite reliably, even when R is not on the PATH.
+    
+    The result is cached, so the search only happens once per session. If no
+    binary is found the error isn't cached, so installing R mid-session works.
     """
     
     # ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
@@ -149,11 +376,16 @@ def _find_rscript_binary():
     )
 
 
+_pkg_root = importlib.resources.files('soilgrids')
+
+@functools.lru_cache(maxsize=None)
 def _pkg_file(path):
-    """Ensure paths to resources work regardless of how the package is installed."""
-    path = importlib.resources \
-        .files('soilgrids') \
-        .joinpath(path)
+    """Ensure paths to resources work regardless of how the package is installed.
+    
+    Resolved paths are cached, since the same few scripts are looked up on
+    every call to R.
+    """
+    path = _pkg_root.joinpath(path)
     
     if not path.exists():
         raise FileNotFoundError(f'File not found: {path}')    
@@ -161,7 +393,25 @@ def _pkg_file(path):
     return str(path)
 
 
-def _rescale(x, a=0, b=1):
-    """Rescale an array to fall within [a, b]"""
-    xmax, xmin = x.max(), x.min()
-    return a + (x - xmin) * (b - a) / (xmax - xmin)
+def _rescale(x, a=0, b=1, clip=True):
+    """Rescale an array to fall within [a, b]
+    
+    Floating point error can leave values a hair outside [a, b], so by default
+    the result is also clipped to that range, in-place.
+    """
+    # NB, casting up front means integer input can't overflow or truncate
+    x = np.asarray(x, dtype=float)
+    xmin = x.min()
+    xrange = x.max() - xmin
+    
+    # A constant array would otherwise give all NaNs
+    if xrange == 0:
+        return np.full(x.shape, float(a))
+    
+    # NB, scale in-place so only one temporary array is allocated
+    out = np.subtract(x, xmin)
+    np.multiply(out, (b - a) / xrange, out=out)
+    np.add(out, a, out=out)
+    if clip:
+        np.clip(out, a, b, out=out)
+    return out
@@ -1,18 +1,28 @@
-from decimal import Decimal
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from itertools import chain
+import functools
+import json
 from typing import Union
 import numpy as np
 import pandas as pd
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 import time
+import urllib.parse
 
-from ._utils import _Throttle, _check_arg, _to_vector, _logger
+from ._utils import _ResponseCache, _Throttle, _check_arg, _to_vector, _logger
 
 def get_soilgrids(lat: float | list[float], 
                   lon: float | list[float], 
                   *, 
                   soil_property: Union[str, list[str], None] = None, 
                   depth: Union[str, list[str], None] = None, 
-                  value: Union[str, list[str], None] = None) -> pd.DataFrame:
+                  value: Union[str, list[str], None] = None,
+                  session: requests.Session | None = None,
+                  max_concurrency: int = 4,
+                  cache_dir: str | None = None) -> pd.DataFrame:
     """Query Soilgrids for soil properties at specified locations.
     
     This function is a wrapper for the Soilgrids API. The returned geojson is
@@ -57,10 +67,25 @@ def get_soilgrids(lat: float | list[float],
             ['Q0.5', 'Q0.05', 'Q0.95', 'mean', 'uncertainty']
             ```
             Note that the mean is always returned, regardless of the selection.
+        `session`: The `requests.Session` to use for querying Soilgrids. 
+            Reusing a session between calls avoids opening a new connection 
+            for every request. Defaults to `None`, in which case a session 
+            shared between calls is used.
+        `max_concurrency`: The maximum number of requests which may be in 
+            flight at once. Requests are still started at most 5 times per
+            minute, but a slow response will not delay the next request. 
+            Defaults to 4.
+        `cache_dir`: A directory in which to cache responses from Soilgrids.
+            If given, responses less than 30 days old are reused rather than
+            queried again, which can save a lot of time when the same points
+            are requested repeatedly. Defaults to `None`, in which case no 
+            caching is done.
 
     Returns:
         `pd.DataFrame`: A data frame with a row for each combination of `lat`, 
         `lon`, `soil_property`, and `depth`, and a column for each `value`. 
+        A `thickness` column giving the thickness of each layer is also 
+        included.
     """
     
     # Allow mixing and and matching of scalars and arrays for lat and lon
@@ -69,67 +94,219 @@ def get_soilgrids(lat: float | list[float],
     # NB, the following checks might seem over-zealous, but they're worth it to 
     # avoid burdensome requests to Soilgrids, if not to provide better error 
     # messages to the user.
-    assert np.array(np.abs(lat) <= 90).all(), \
-        'Invalid `lat`. \n  i: Check `lat` is in the range [-90, 90].'
-    
-    assert np.array(np.abs(lon) <= 180).all(), \
-        'Invalid `lon`. \n  i: Check `lon` is in the range [-180, 180].'
-    
-    soil_property = _check_arg(soil_property, name='soil_property', allowed_vals=[
-        'bdod', 'cec', 'cfvo', 'clay', 'nitrogen', 'ocd', 'ocs', 'phh2o', 
-        'sand', 'silt', 'soc', 'wv0010', 'wv0033', 'wv1500'
-    ])
-    depth = _check_arg(depth, name='depth', allowed_vals=[
-        '0-5cm', '0-30cm', '5-15cm', '15-30cm', '30-60cm', '60-100cm', 
-        '100-200cm'
-    ])
-    value = _check_arg(value, name='value', allowed_vals=[
-        'Q0.5', 'Q0.05', 'Q0.95', 'mean', 'uncertainty'
-    ])
-    value = list(set(value + ['mean']))
-    
-    results = [
-        _query_soilgrids(
-            lat, lon, 
-            soil_property=soil_property, 
-            depth=depth, 
-            value=value
-        )
-        for lat, lon in zip(lat, lon)
+    # NB, written so that NaNs count as invalid
+    bad_lat = lat[~(np.abs(lat) <= 90)]
+    assert bad_lat.size == 0, \
+        'Invalid `lat`. \n  i: Check `lat` is in the range [-90, 90].' \
+        f'\n  i: Invalid values include: {bad_lat[:5].tolist()}.'
+    
+    bad_lon = lon[~(np.abs(lon) <= 180)]
+    assert bad_lon.size == 0, \
+        'Invalid `lon`. \n  i: Check `lon` is in the range [-180, 180].' \
+        f'\n  i: Invalid values include: {bad_lon[:5].tolist()}.'
+    
+    # NB, converted to tuples once here so they can be used as-is to build 
+    # (and cache) the query for each point
+    soil_property = tuple(_check_arg(soil_property, 'soil_property', _soil_properties))
+    depth         = tuple(_check_arg(depth,         'depth',         _depths))
+    value         = tuple(_check_arg(value,         'value',         _values))
+    # NB, sorted so the query (and so the output) doesn't depend on set order
+    value = tuple(sorted(set(value) | {'mean'}))
+    
+    # Coordinates are rounded to 6 decimal places for the query, so points 
+    # which are the same after rounding (e.g. from broadcasting) would give 
+    # identical requests. Each distinct point is only queried once, and its 
+    # rows are reused for any repeats. NB, plain floats are cheaper to work 
+    # with than numpy scalars for the per-point formatting which happens here
+    # and downstream.
+    points = {}
+    point_ids = [
+        points.setdefault((f'{lat_i:.6f}', f'{lon_i:.6f}'), (len(points), lat_i, lon_i))[0]
+        for lat_i, lon_i in zip(lat.tolist(), lon.tolist())
     ]
-        
-    return pd.concat([_parse_response(r) for r in results])
+    
+    point_rows = list(_iter_points(
+        [lat_i for _, lat_i, _ in points.values()], 
+        [lon_i for _, _, lon_i in points.values()], 
+        soil_property=soil_property, 
+        depth=depth, 
+        value=value,
+        session=session or _default_session(),
+        max_concurrency=max_concurrency,
+        cache=_ResponseCache(cache_dir) if cache_dir is not None else None
+    ))
+    
+    # NB, rows for every point are collected into a single DataFrame, rather
+    # than creating a DataFrame per point and concatenating them
+    rows = list(chain.from_iterable(point_rows[i] for i in point_ids))
+    
+    return _build_output(rows, soil_property=soil_property, value=value)
     
     
 
 # ISRIC asks developers to limit requests to 5/minute: https://rest.isric.org
-_throttle_requests = _Throttle(60/5)
+_throttle_requests = _Throttle(60/5, burst=5)
 
 _base_url = 'https://rest.isric.org/soilgrids/v2.0/'    
 
-def _query_soilgrids(lat, lon, soil_property=None, depth=None, value=None):
+# Allowed values for arguments to `get_soilgrids()`
+_soil_properties = [
+    'bdod', 'cec', 'cfvo', 'clay', 'nitrogen', 'ocd', 'ocs', 'phh2o', 
+    'sand', 'silt', 'soc', 'wv0010', 'wv0033', 'wv1500'
+]
+_depths = [
+    '0-5cm', '0-30cm', '5-15cm', '15-30cm', '30-60cm', '60-100cm', '100-200cm'
+]
+_values = ['Q0.5', 'Q0.05', 'Q0.95', 'mean', 'uncertainty']
+
+
+def _new_session():
+    """Create a session which keeps connections alive and retries server errors."""
+    
+    session = requests.Session()
+    
+    # NB, 429s are left to _query_soilgrids(), which waits much longer than
+    # would be sensible for a general-purpose retry
+    session.mount(_base_url, HTTPAdapter(max_retries=Retry(
+        total=3, 
+        backoff_factor=0.3, 
+        status_forcelist=[502, 503, 504],
+        raise_on_status=False
+    )))
+    
+    return session
+
+
+_shared_session = None
+
+def _default_session():
+    """Get the session used when none is given, so connections are kept alive 
+    between calls to `get_soilgrids()`."""
+    global _shared_session
+    if _shared_session is None:
+        _shared_session = _new_session()
+    return _shared_session
+
+
+def _iter_points(lat, lon, *, soil_property, depth, value, session, 
+                 max_concurrency, cache):
+    """Query Soilgrids for each point, yielding the rows for each in order.
+    
+    Responses are parsed as soon as they arrive rather than once all requests
+    have finished, so the raw geojson for every point is never held in memory
+    at once. Parsing happens in the worker threads, so it overlaps with the
+    main thread waiting on the throttle.
+    """
+    
+    # Each item is (cache key, future giving the geojson and parsed rows, 
+    # whether it's cached)
+    pending = deque()
+    
+    def finished(wait):
+        while pending and (wait or pending[0][1].done()):
+            key, future, is_cached = pending.popleft()
+            result, rows = future.result()
+            if cache is not None and not is_cached:
+                cache.set(key, result)
+            yield rows
+    
+    with ThreadPoolExecutor(max_workers=max_concurrency) as executor:
+        for lat_i, lon_i in zip(lat, lon):
+            key = _cache_key(lat_i, lon_i, soil_property, depth, value)
+            result = cache.get(key) if cache is not None else None
+            
+            if result is not None:
+                _logger.info(
+                    'Using cached result for lat=%s, lon=%s', key['lat'], key['lon']
+                )
+                pending.append((key, executor.submit(_with_rows, result), True))
+                
+            else:
+                # No point sending more requests if one has already failed
+                if any(f.done() and f.exception() for _, f, _ in pending):
+                    break
+                
+                # NB, throttling happens here rather than in the worker 
+                # threads so that requests are always started in sequence
+                _throttle_requests()
+                pending.append((key, executor.submit(
+                    _query_and_parse,
+                    lat_i, lon_i, 
+                    soil_property=soil_property, 
+                    depth=depth, 
+                    value=value,
+                    session=session
+                ), False))
+            
+            yield from finished(wait=False)
+        
+        yield from finished(wait=True)
+
+
+def _query_and_parse(lat, lon, **kwargs):
+    """Query Soilgrids for a single point, returning the geojson response along
+    with its parsed rows."""
+    return _with_rows(_query_soilgrids(lat, lon, **kwargs))
+
+
+def _with_rows(result):
+    """Pair a geojson response with its parsed rows."""
+    return result, _response_rows(result)
+
+
+def _cache_key(lat, lon, soil_property, depth, value):
+    """Identify a query to Soilgrids in a form suitable for caching."""
+    return {
+        # Coordinates are rounded to 6 decimal places by _query_soilgrids()
+        'lat': f'{lat:.6f}',
+        'lon': f'{lon:.6f}',
+        'soil_property': sorted(soil_property),
+        'depth': sorted(depth),
+        'value': sorted(value)
+    }
+
+
+@functools.lru_cache(maxsize=32)
+def _encode_query(soil_property, depth, value):
+    """URL-encode the parts of a query which don't depend on the coordinates.
+    
+    Arguments should be tuples (or `None`) so they can be cached.
+    """
+    params = {
+        # NB, `property` is a reserved keyword in Python, so it's best to use
+        # a different name elsewhere
+        'property': soil_property,
+        'depth': depth,
+        'value': value
+    }
+    params = {k: v for k, v in params.items() if v is not None}
+    return '&' + urllib.parse.urlencode(params, doseq=True) if params else ''
+
+
+def _query_soilgrids(lat, lon, soil_property=None, depth=None, value=None, 
+                     session=None):
     """Perform the actual API request, with some basic handling for 429 errors."""
     
     # The `float` type doesn't always give exactly 6 decimal places, which 
     # causes Soilgrids to give a much more precise response than required.
-    lat, lon = round(Decimal(float(lat)), 6), round(Decimal(float(lon)), 6)
+    # NB, formatting rounds the exact binary value, just as Decimal would.
+    lat, lon = f'{float(lat):.6f}', f'{float(lon):.6f}'
     
-    _throttle_requests()
-    _logger.info(f'Querying Soilgrids for lat={lat}, lon={lon}')
+    # NB, arguments are passed separately so the message is only formatted if
+    # it's actually going to be logged
+    _logger.info('Querying Soilgrids for lat=%s, lon=%s', lat, lon)
+    
+    # Only the coordinates change between points, so the rest of the query 
+    # string is encoded once and reused. NB, get_soilgrids() passes tuples, 
+    # which can be used as-is.
+    url = f'{_base_url}properties/query?lat={lat}&lon={lon}' + _encode_query(*(
+        x if x is None or isinstance(x, tuple) else tuple(_to_vector(x)) 
+        for x in (soil_property, depth, value)
+    ))
     
     def perform_request():
-        return requests.get(
-            _base_url + 'properties/query',
-            params={
-                'lat': lat, 
-                'lon': lon,
-                # NB, `property` is a reserved keyword in Python, so it's best
-                # to use a different name here
-                'property': soil_property,
-                'depth': depth,
-                'value': value
-            },
-            headers={'accept': 'application/geojson'}
+        return (session or requests).get(
+            url, headers={'accept': 'application/geojson'}
         )
     
     resp = perform_request()
@@ -143,9 +320,11 @@ def _query_soilgrids(lat, lon, soil_property=None, depth=None, value=None):
     # Raise anything but a 200 response as an exception
     resp.raise_for_status()
     
+    # NB, parsing the raw bytes skips the charset guessing `resp.json()` does
+    # first; `json.loads()` works out the (UTF) encoding itself.
     try:
-        json_output = resp.json()
-    except requests.exceptions.JSONDecodeError as exc:
+        json_output = json.loads(resp.content)
+    except ValueError as exc:
         raise RuntimeError(
             'Malformed JSON response from Soilgrids.'
         ) from exc
@@ -154,52 +333,85 @@ def _query_soilgrids(lat, lon, soil_property=None, depth=None, value=None):
 
 
 
-def _parse_response(x):
-    """Parse the full geojson response from _query_soilgrids() into a DataFrame."""
+def _build_output(rows, soil_property, value):
+    """Build the output of get_soilgrids() from the parsed rows for each point.
+    
+    Each column is created with its final dtype directly, rather than letting
+    pandas infer the dtypes and converting them afterwards. The columns are
+    always the same, even if no data is returned.
+    """
+    
+    def column(name, dtype=None):
+        return np.array([row.get(name) for row in rows], dtype=dtype)
+    
+    # Categoricals take up less memory and make for quicker grouping later on.
+    # NB, every string column only ever holds a handful of distinct values.
+    def categorical(name, categories=None):
+        return pd.Categorical([row.get(name) for row in rows], categories=categories)
+    
+    # Depths are in cm, so easily fit in an int16. Values are given as 
+    # integers in mapped units, so float32 holds them exactly while still 
+    # allowing for missing values.
+    top_depth    = column('top_depth',    np.int16)
+    bottom_depth = column('bottom_depth', np.int16)
+    
+    # NB, sorted so that the output (e.g. the order of groups in later 
+    # aggregations) doesn't depend on the order properties were requested in
+    properties = sorted(set(soil_property))
+    
+    return pd.DataFrame({
+        'lat':              column('lat', np.float64),
+        'lon':              column('lon', np.float64),
+        'soil_property':    categorical('soil_property', categories=properties),
+        'd_factor':         column('d_factor', np.int16),
+        'mapped_units':     categorical('mapped_units'),
+        'target_units':     categorical('target_units'),
+        'uncertainty_unit': categorical('uncertainty_unit'),
+        'depth':            categorical('depth'),
+        'top_depth':        top_depth,
+        'bottom_depth':     bottom_depth,
+        'thickness':        bottom_depth - top_depth,
+        'unit_depth':       categorical('unit_depth'),
+        **{col: column(col, np.float32) for col in value}
+    }, copy=False)
+
+
+
+def _response_rows(x):
+    """Get a row (as a dict) for each property and depth in the full geojson 
+    response from _query_soilgrids()."""
     
     try:
         # Should both be scalars. Note these are returned in reverse order to 
         # that used throughout this package
         lon, lat = x['geometry']['coordinates']    
         
-        layers = pd.concat([_parse_property(p) for p in x['properties']['layers']])
-        
-        layers.insert(0, 'lon', lon)
-        layers.insert(0, 'lat', lat)   
-        
-        layers.reset_index(drop=True, inplace=True)
+        # Building the rows up as plain dicts and creating a single DataFrame
+        # at the end is much quicker than creating and concatenating lots of
+        # small DataFrames
+        return [
+            {'lat': lat, 'lon': lon, **row}
+            for p in x['properties']['layers']
+            for row in _property_rows(p)
+        ]
 
     except Exception as exc:
         raise RuntimeError('Failed to parse geojson response') from exc
 
-    return layers
-
 
 
-def _parse_property(x):
-    """Parse a single property/layer from the geojson response of 
-    _query_soilgrids() into a DataFrame."""
+def _property_rows(x):
+    """Get a row (as a dict) for each depth of a single property/layer."""
     
     # Should be <=1 row per property
-    unit_measures = pd.DataFrame({
-        'soil_property': [x['name']],
-        **x['unit_measure']
-    })
+    unit_measures = {'soil_property': x['name'], **x['unit_measure']}
     
-    # Should be <=1 row per depth, <=1 col per value
-    depths = pd.concat([_parse_depth(d) for d in x['depths']])
-    
-    return pd.DataFrame.merge(unit_measures, depths, how='cross')
+    # Should be <=1 row per depth
+    return [{**unit_measures, **_depth_row(d)} for d in x['depths']]
 
 
 
-def _parse_depth(x):
-    """Parse a single depth from a single property from the geojson response of
-    _query_soilgrids() into a DataFrame."""
+def _depth_row(x):
+    """Get a single row (as a dict) for a single depth of a single property."""
     
-    return pd.DataFrame({
-        'depth': [x['label']], 
-        **x['range'], 
-        **x['values']
-    })
-
+    return {'depth': x['label'], **x['range'], **x['values']}
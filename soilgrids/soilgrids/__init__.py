@@ -6,14 +6,23 @@
 # read, maintain and extend.
 # ============================================================================ #
 
+import numpy as np
 import pandas as pd
 
+from ..api_requests import _new_session, _values
+
 class SoilGrids:
     """Read and perform basic analysis of Soilgrids data.
     
     Provides a convenient interface to the Soilgrids API, and some basic data
     wrangling and analysis methods.
     
+    Args:
+        `cache_dir` (`str | None`): A directory in which to cache responses 
+            from Soilgrids, so that repeated queries for the same points can
+            be answered without another request. Defaults to `None`, in which
+            case no caching is done.
+    
     Attributes:
         `data` (`pandas.DataFrame`): The data returned by the last call to 
             `get_points()` or `get_points_sample()`. Note that this generates
@@ -43,9 +52,13 @@ class SoilGrids:
     from ._visualise    import plot_ocs_property_relationships, plot_property_map
     
     
-    def __init__(self):
+    def __init__(self, cache_dir: str | None=None):
         self._data = None
         self._region_bounds = None
+        self._session = _new_session()
+        self._cache_dir = cache_dir
+        self._rng = np.random.default_rng()
+        self._aggregate_means_cache = {}
     
     
     @property
@@ -55,7 +68,9 @@ class SoilGrids:
         Returns the results of the last call to `get_points()` or 
         `get_points_sample()`. This property can also be set manually (e.g.
         using the output of `get_soilgrids()`), in which case the 
-        `region_bounds` property is also set.
+        `region_bounds` property is also set. Data set manually is stored
+        using the same compact dtypes as `get_soilgrids()` returns, e.g. 
+        categoricals for `soil_property`.
 
         Raises:
             `ValueError`: If no data has been returned yet.
@@ -71,11 +86,14 @@ class SoilGrids:
     
     @data.setter
     def data(self, value):
+        # NB, numpy's min/max are much quicker than iterating over the columns
+        lat, lon = value['lat'].to_numpy(), value['lon'].to_numpy()
         self._region_bounds = {
-            'lat': (min(value['lat']), max(value['lat'])),
-            'lon': (min(value['lon']), max(value['lon']))
-        } 
-        self._data = value
+            'lat': (float(lat.min()), float(lat.max())),
+            'lon': (float(lon.min()), float(lon.max()))
+        }
+        self._aggregate_means_cache.clear()
+        self._data = _compact_dtypes(value)
     
     
     @property
@@ -93,6 +111,36 @@ class SoilGrids:
         return self._region_bounds
 
 
+def _compact_dtypes(data: pd.DataFrame) -> pd.DataFrame:
+    """Convert columns to the dtypes used by `get_soilgrids()`.
+    
+    Categoricals make for much quicker grouping and filtering than strings,
+    and narrower numeric types take up less memory. Columns which aren't 
+    present are skipped, as are integer columns with missing values, which
+    an int16 can't hold.
+    """
+    
+    int_cols = ['d_factor', 'top_depth', 'bottom_depth', 'thickness']
+    
+    dtypes = {
+        'soil_property': 'category',
+        'mapped_units': 'category',
+        'target_units': 'category',
+        'uncertainty_unit': 'category',
+        'depth': 'category',
+        'unit_depth': 'category',
+        **{
+            col: np.int16 for col in int_cols 
+            if col in data.columns and not data[col].isna().any()
+        },
+        **{col: np.float32 for col in _values}
+    }
+    
+    return data.astype({
+        col: dtype for col, dtype in dtypes.items() if col in data.columns
+    })
+
+
 def _check_data_available(x: SoilGrids) -> None:
     """Raise an error if no data has been queried yet."""
     
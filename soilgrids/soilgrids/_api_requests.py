@@ -1,7 +1,6 @@
 from ..api_requests import get_soilgrids
 
 from typing import Union
-import numpy as np
 import pandas as pd
 
 
@@ -11,7 +10,8 @@ def get_points(self,
                *, 
                soil_property: Union[str, list[str], None]=None, 
                depth: Union[str, list[str], None]=None, 
-               value: Union[str, list[str], None]=None) -> pd.DataFrame:
+               value: Union[str, list[str], None]=None,
+               max_concurrency: int=4) -> pd.DataFrame:
     """Query Soilgrids for soil properties at specified locations.
 
     This method is a wrapper for the Soilgrids API. The returned geojson is
@@ -60,16 +60,23 @@ def get_points(self,
             ```
             Note that the mean is always returned, regardless of the 
             selection.
+        `max_concurrency`: The maximum number of requests which may be in 
+            flight at once. Requests are still started at most 5 times per
+            minute, but a slow response will not delay the next request. 
+            Defaults to 4.
 
     Returns:
         `pd.DataFrame`: A data frame with a row for each combination of 
             `lat`, `lon`, `soil_property`, and `depth`, and a column for 
-            each `value`. 
+            each `value`. A `thickness` column giving the thickness of each
+            layer is also included.
     """
     
     self.data = get_soilgrids(
         lat, lon, 
-        soil_property=soil_property, depth=depth, value=value
+        soil_property=soil_property, depth=depth, value=value,
+        session=self._session, max_concurrency=max_concurrency,
+        cache_dir=self._cache_dir
     )
     
 
@@ -82,7 +89,8 @@ def get_points_sample(self,
                       lon_max: float=180,
                       soil_property: Union[str, list[str], None]=None, 
                       depth: Union[str, list[str], None]=None, 
-                      value: Union[str, list[str], None]=None) -> pd.DataFrame:
+                      value: Union[str, list[str], None]=None,
+                      max_concurrency: int=4) -> pd.DataFrame:
     """Query Soilgrids for a random set of coordinates.
     
     This method is a wrapper for the Soilgrids API. The returned geojson 
@@ -133,23 +141,34 @@ def get_points_sample(self,
             ```
             Note that the mean is always returned, regardless of the 
             selection.
+        `max_concurrency`: The maximum number of requests which may be in 
+            flight at once. Requests are still started at most 5 times per
+            minute, but a slow response will not delay the next request. 
+            Defaults to 4.
 
     Returns:
         `pd.DataFrame`: A data frame with a row for each combination of 
             `lat`, `lon`, `soil_property`, and `depth`, and a column for 
-            each `value`. 
+            each `value`. A `thickness` column giving the thickness of each
+            layer is also included.
     """
     
-    lat_min, lat_max = min(lat_min, lat_max), max(lat_min, lat_max)
-    lon_min, lon_max = min(lon_min, lon_max), max(lon_min, lon_max)
+    # NB, the bounds can be given either way round
+    if lat_min > lat_max:
+        lat_min, lat_max = lat_max, lat_min
+    if lon_min > lon_max:
+        lon_min, lon_max = lon_max, lon_min
     
     self._region_bounds = {
         'lat': (lat_min, lat_max),
         'lon': (lon_min, lon_max)
     }
      
+    self._aggregate_means_cache.clear()
     self._data = get_soilgrids(
-        lat_min + (lat_max - lat_min) * np.random.random_sample(n),
-        lon_min + (lon_max - lon_min) * np.random.random_sample(n),
-        soil_property=soil_property, depth=depth, value=value
+        self._rng.uniform(lat_min, lat_max, size=n),
+        self._rng.uniform(lon_min, lon_max, size=n),
+        soil_property=soil_property, depth=depth, value=value,
+        session=self._session, max_concurrency=max_concurrency,
+        cache_dir=self._cache_dir
     )
@@ -36,37 +36,59 @@ def rank_properties(self,
     out = self.aggregate_means(top_depth, bottom_depth)
     
     if subset is not None:
-        out=out.query(f"soil_property in {subset}")
+        out = out[out['soil_property'].isin(subset)]
     
-    return out \
+    # NB, `rank()` works within each group regardless of row order, so there's
+    # no need to sort first. Tied descriptions are still joined in a stable
+    # order, as rows come out of `aggregate_means()` sorted by property.
+    out = out \
         .dropna(subset='mean') \
-        .sort_values(
-            ['lat', 'lon', 'mapped_units', 'unit_depth', 'mean'], 
-            ascending=False
-        ) \
-        .groupby(
-            ['lat', 'lon', 'mapped_units', 'unit_depth'], 
-            as_index=False
+        .assign(
+            rank=lambda x: x \
+                .groupby(
+                    ['lat', 'lon', 'mapped_units', 'unit_depth'], 
+                    observed=True,
+                    sort=False
+                )['mean'] \
+                .rank(method='dense', ascending=False) \
+                .astype(int)
         ) \
-        .apply(lambda x: x.assign(
-            rank=x['mean'].rank(method='dense', ascending=False)
-        )) \
         .assign(
-            rank_desc=lambda x: 
-                'property_no' + x['rank'].astype(int).astype(str),
             mean = lambda x: 
                 x['mean'].astype(int).astype(str),
+            # NB, building the descriptions column-wise is much quicker than 
+            # formatting each row in turn with `agg(..., axis=1)`
             property_desc=lambda x: 
-                x.agg("{0[soil_property]}: {0[mean]:>3}".format, axis=1)
-        ) \
-        .pivot_table(
-            index=['lat', 'lon', 'depth', 'mapped_units'],
-            values='property_desc',
-            columns='rank_desc',
-            aggfunc=lambda x: "/".join(x) # Shouldn't be needed
-        ) \
+                x['soil_property'].astype(str) + ': ' + x['mean'].str.rjust(3)
+        )
+    
+    # Tied means share a rank, so occasionally several descriptions end up in
+    # the same cell. Only then are they joined, rather than using a 
+    # `pivot_table()` which calls a Python function for every cell.
+    index = ['lat', 'lon', 'depth', 'mapped_units']
+    if out.duplicated(index + ['rank']).any():
+        out = out \
+            .groupby(index + ['rank'], observed=True, sort=False) \
+            ['property_desc'] \
+            .agg('/'.join) \
+            .reset_index()
+    
+    # Each description's cell in the wide output is given by its group and 
+    # its rank, so descriptions can be written straight into place rather 
+    # than going through `pivot()`
+    groups = out.groupby(index, observed=True)
+    ranks = out['rank'].to_numpy(dtype=int)
+    
+    wide = np.full((groups.ngroups, ranks.max(initial=0)), np.nan, dtype=object)
+    wide[groups.ngroup().to_numpy(), ranks - 1] = out['property_desc'].to_numpy()
+    
+    rank_desc = pd.Index(
+        [f'property_no{i}' for i in range(1, wide.shape[1] + 1)], 
+        name='rank_desc'
+    )
+    
+    return pd.DataFrame(wide, index=groups.size().index, columns=rank_desc) \
         .reset_index()
-
         
 def aggregate_means(self, 
                     top_depth: int | None=None, 
@@ -90,6 +112,9 @@ def aggregate_means(self,
     Once this has been done, it is possible to compare sand, silt, and clay
     with OCS.
     
+    Results are cached, so repeated calls with the same arguments are cheap 
+    until the data is next set.
+    
     Args:
         `top_depth` (`float | None`): The minimum top depth to include in the 
             aggregated results. Note that the value returned in the output 
@@ -108,74 +133,127 @@ def aggregate_means(self,
         `mapped_units`, `unit_depth`, `soil_property`, `top_depth`, 
         `bottom_depth`, and `mean`.
     """
-    assert 'mean' in self.data.keys(), \
+    data = self.data
+    
+    assert 'mean' in data.columns, \
         'No `mean` column. Call `get_points()` or `get_points_sample()`' \
         " with `value='mean'` first."
     
-    data = self.data
+    cache_key = (top_depth, bottom_depth, skipna)
+    if cache_key in self._aggregate_means_cache:
+        return self._aggregate_means_cache[cache_key].copy()
     
-    top_depth = top_depth or -np.inf
-    bottom_depth = bottom_depth or np.Inf
+    # NB, with no depth bounds the comparisons can be skipped, but rows with 
+    # missing depths must still be dropped, as the comparisons would do
+    if top_depth or bottom_depth:
+        top_depth = top_depth or -np.inf
+        bottom_depth = bottom_depth or np.Inf
+        
+        data = data[
+            (top_depth <= data['top_depth']) & 
+            (data['bottom_depth'] <= bottom_depth)
+        ]
+    else:
+        data = data[data['top_depth'].notna() & data['bottom_depth'].notna()]
     
-    data = data[
-        (top_depth <= data['top_depth']) & 
-        (data['bottom_depth'] <= bottom_depth)
-    ]
+    # ~~ What's happening here? ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+    # Say we have the following values:
+    #
+    #    soil_property     depth   mean
+    #             sand    -1- 5cm      1
+    #             sand    4-15cm      2
+    #             sand   14-30cm      3
+    #
+    # To get the mean for sand across the whole -1-30cm, we can't 
+    # just do mean([0, 2, 3]), because this would skew the result 
+    # towards the thinner layers. Instead, we first have to weight 
+    # each value according to the thickness of the layer it 
+    # represents:
+    #
+    #   * Row 0 applies to 5cm of the 0-30cm layer
+    #   * Row 1 applies to 10cm of the 0-30cm layer
+    #   * Row 2 applies to 15cm of the 0-30cm layer
+    # 
+    # So we need to weight row 0 by 5/30, row 2 by 10/30, and row 3
+    # by 14/30. Once we've done that, the mean across the whole
+    # -1-30cm layer can be found by summing the weighted values:
+    #   
+    #   mean_overall = sum([0 * 5/30, 2 * 10/30, 3 * 15/30]) = 2.333
+    #
+    # This gets rounded because it doesn't make sense to output more 
+    # precision than the original data.
+    # ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+    group_cols = ['lat', 'lon', 'mapped_units', 'unit_depth', 'soil_property']
+    
+    # Grouping by several columns is relatively expensive, so it's only done
+    # once and the resulting group IDs are reused. Rows with missing keys 
+    # don't get an ID and are dropped, as they would be by `groupby()` itself.
+    group_ids = data.groupby(group_cols, observed=True).ngroup()
+    has_group = group_ids.ge(0)
+    data = data[has_group]
+    group_ids = group_ids[has_group].to_numpy(dtype=int)
+    
+    # Computing the weights over the whole frame at once is much quicker 
+    # than assigning them group-by-group with `apply()`. NB, the weighted 
+    # values are a fresh array, so can be rounded in-place.
+    weighted_mean = _weight_by_thickness(
+        data['mean'].to_numpy(dtype=float),
+        _thickness(data).to_numpy(dtype=float),
+        group_ids
+    )
+    np.round(weighted_mean, out=weighted_mean)
     
     out = data \
-        .groupby(
-            # ~~ What's happening here? ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
-            # Say we have the following values:
-            #
-            #    soil_property     depth   mean
-            #             sand    -1- 5cm      1
-            #             sand    4-15cm      2
-            #             sand   14-30cm      3
-            #
-            # To get the mean for sand across the whole -1-30cm, we can't 
-            # just do mean([0, 2, 3]), because this would skew the result 
-            # towards the thinner layers. Instead, we first have to weight 
-            # each value according to the thickness of the layer it 
-            # represents:
-            #
-            #   * Row 0 applies to 5cm of the 0-30cm layer
-            #   * Row 1 applies to 10cm of the 0-30cm layer
-            #   * Row 2 applies to 15cm of the 0-30cm layer
-            # 
-            # So we need to weight row 0 by 5/30, row 2 by 10/30, and row 3
-            # by 14/30. Once we've done that, the mean across the whole
-            # -1-30cm layer can be found by summing the weighted values:
-            #   
-            #   mean_overall = sum([0 * 5/30, 2 * 10/30, 3 * 15/30]) = 2.333
-            #
-            # This gets rounded because it doesn't make sense to output more 
-            # precision than the original data.
-            # ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
-            ['lat', 'lon', 'mapped_units', 'unit_depth', 'soil_property'], 
-            as_index=False
-        ) \
-        .apply(lambda x: x.assign(
-            thickness = lambda x: x['bottom_depth'] - x['top_depth'],
-            mean = lambda x: (x['mean'] * x['thickness'] / x['thickness'].sum()) \
-                .astype(float) \
-                .round()
-        )) \
-        .groupby(
-            ['lat', 'lon', 'mapped_units', 'unit_depth', 'soil_property'], 
-            as_index=False
-        ) \
+        .groupby(group_ids) \
         .agg({
+            **{col: 'first' for col in group_cols},
             'top_depth': 'min',
-            'bottom_depth': 'max',
-            'mean': lambda m: m.sum(skipna = skipna)
-        }) 
-    
-    # Re-create the 'depth' col for convenience
-    out.insert(2, 'depth', 
-        out['top_depth'].astype(str) + 
-        '-' + 
-        out['bottom_depth'].astype(str) + 
-        out['unit_depth']
+            'bottom_depth': 'max'
+        })
+    
+    # NB, replacing the index (of group IDs) directly avoids the copy that
+    # `reset_index()` would make
+    out.index = pd.RangeIndex(len(out))
+    
+    # The weighted values are summed with the same `bincount()` kernel as the
+    # thicknesses, which is much quicker than a pandas reduction. Missing
+    # values propagate through the sum unless they're zeroed out first.
+    if skipna:
+        np.nan_to_num(weighted_mean, copy=False)
+    out['mean'] = np.bincount(group_ids, weights=weighted_mean, minlength=len(out))
+    
+    # Re-create the 'depth' col for convenience. NB, there are only ever a 
+    # handful of distinct depth ranges, so each label is formatted once and
+    # then spread over the rows, rather than building strings row-by-row.
+    depth_ranges = out.groupby(
+        ['top_depth', 'bottom_depth', 'unit_depth'], observed=True, sort=False
     )
+    depth_labels = np.array(
+        [f'{top}-{bottom}{unit}' for top, bottom, unit in depth_ranges.size().index], 
+        dtype=object
+    )
+    
+    # NB, as for `group_ids`, rows with missing keys don't get an ID, so they 
+    # get a missing label rather than being used as an index
+    depth_ids = depth_ranges.ngroup()
+    has_depth = depth_ids.ge(0).to_numpy()
+    depth = np.full(len(out), np.nan, dtype=object)
+    depth[has_depth] = depth_labels[depth_ids[has_depth].to_numpy(dtype=int)]
+    out.insert(2, 'depth', depth)
     
-    return out
+    self._aggregate_means_cache[cache_key] = out
+    
+    return out.copy()
+
+
+def _weight_by_thickness(mean, thickness, group_ids):
+    """Weight each mean by its layer's share of the total thickness of its group."""
+    total_thickness = np.bincount(group_ids, weights=thickness)
+    return mean * thickness / total_thickness[group_ids]
+
+
+def _thickness(data):
+    """Get the thickness of each layer, computing it if it's not already present."""
+    if 'thickness' in data.columns:
+        return data['thickness']
+    return data['bottom_depth'] - data['top_depth']
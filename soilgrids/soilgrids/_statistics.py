@@ -1,4 +1,4 @@
-from .._utils import _rscript, _logger
+from .._utils import _r_worker, _logger
 
 def ocs_correlation(self,
                     *,
@@ -48,12 +48,10 @@ def ocs_correlation(self,
         `None`: The model summary is printed to the console.
     """
     pivoted_data = self.aggregate_means(top_depth, bottom_depth) \
-        .query("soil_property in ['sand', 'silt', 'clay', 'ocs']") \
-        .pivot_table(
-            index=['lat', 'lon'],
-            columns='soil_property',
-            values='mean'
-        ) \
+        .loc[lambda x: x['soil_property'].isin(['sand', 'silt', 'clay', 'ocs'])] \
+        .pivot(index=['lat', 'lon'], columns='soil_property', values='mean') \
+        .dropna(how='all') \
+        .dropna(axis=1, how='all') \
         .reset_index()
     
     assert len(pivoted_data) >= 20, \
@@ -64,13 +62,7 @@ def ocs_correlation(self,
         missing_cols = "', '".join(missing_cols)
         raise RuntimeError(f"No non-missing values for '{missing_cols}'.")
     
-    model_summary = _rscript(
-        'r-scripts/linear-regression.R', 
-        
-        # Unfortunately, Windows hates line breaks in command line args. So, 
-        # just pass the CSV line-by-line and reconstruct it in R.
-        *pivoted_data.to_csv(index=False).split("\r\n")
-    )
+    model_summary = _r_worker('r-scripts/linear-regression.R', data=pivoted_data)
     
     if capture_output:
         return model_summary
@@ -1,15 +1,18 @@
+from typing import TYPE_CHECKING
+
 from .._utils import _rescale, _to_vector
 
-import numpy as np
-import plotly.express as px
-import plotly.graph_objects as go
+# NB, plotly is slow to import, so it's only imported when a plot is actually
+# made rather than whenever the package is loaded
+if TYPE_CHECKING:
+    import plotly.graph_objects as go
 
 
 def plot_ocs_property_relationships(self, 
                                     props: str | list[str] | None=None,
                                     *,
                                     top_depth: int | None=None, 
-                                    bottom_depth: int | None=None) -> go.Figure:
+                                    bottom_depth: int | None=None) -> 'go.Figure':
     """Plot the relationships between OCS and other soil properties.
     
     Produces a plot with multiple panels, where each panel
@@ -42,30 +45,30 @@ def plot_ocs_property_relationships(self,
         the `show()` method to display this graphically in an interactive
         context.
     """
+    import plotly.express as px
+    
     data = self.aggregate_means(top_depth, bottom_depth) 
         
-    soil_types_data = data.query("soil_property != 'ocs'")
+    # NB, the data is split using a single mask rather than filtering it twice
+    is_ocs = (data['soil_property'] == 'ocs').to_numpy()
+    soil_types_data = data[~is_ocs]
         
     if props is not None:
         soil_types_data = soil_types_data \
-            .query(f'soil_property in {_to_vector(props)}') \
-            .reset_index()
+            .loc[lambda x: x['soil_property'].isin(_to_vector(props))]
         
-    ocs_data = data \
-        .query("soil_property == 'ocs'") \
-        .rename(columns={'mean': 'mean_ocs'}) \
-        .reset_index()
+    ocs_data = data[is_ocs].rename(columns={'mean': 'mean_ocs'})
         
+    # NB, joining against an index is quicker than merging on columns
     plot_data = soil_types_data \
-        .merge(
-            ocs_data.filter(['lat', 'lon', 'mean_ocs']), 
-            on=['lat', 'lon'], 
-            how = 'left'
-        ) \
-        .assign(panel=lambda x: 
-            x['soil_property'] + ' (' + x['mapped_units'] + ')'
-        ) \
-        .reset_index()
+        .join(ocs_data.set_index(['lat', 'lon'])['mean_ocs'], on=['lat', 'lon']) \
+        .assign(
+            # NB, plotly groups by colour, so categoricals would give empty 
+            # groups for any unused properties
+            soil_property=lambda x: x['soil_property'].astype(str),
+            panel=lambda x: 
+                x['soil_property'] + ' (' + x['mapped_units'].astype(str) + ')'
+        )
     
     properties = set(plot_data['soil_property'])
         
@@ -80,10 +83,10 @@ def plot_ocs_property_relationships(self,
     )
     
     # Slight hack to set axis titles using panel titles - no easy way to do this. Yuck!
-    panel_titles = []
-    plot.for_each_annotation(lambda p: panel_titles.append(p.text))
-    axis_titles = ['Mean ' + x.split('=')[-1].capitalize() for x in reversed(panel_titles)]
-    plot = plot.for_each_xaxis(lambda x: x.update(title={'text': axis_titles.pop()}))
+    panel_titles = [p.text for p in plot.layout.annotations]
+    axis_titles = ['Mean ' + x.split('=')[-1].capitalize() for x in panel_titles]
+    for xaxis, title in zip(plot.select_xaxes(), axis_titles):
+        xaxis.update(title={'text': title})
         
     plot = plot \
         .update_xaxes(matches=None) \
@@ -92,7 +95,7 @@ def plot_ocs_property_relationships(self,
         .update_layout(
             title='Organic Carbon Stock vs Other Properties',
             yaxis_title='Organic Carbon Stock ({})'.format(
-                ocs_data['mapped_units'][0]
+                ocs_data['mapped_units'].iloc[0]
             )
         ) 
         
@@ -104,7 +107,7 @@ def plot_property_map(self,
                       *,
                       top_depth: int | None=None,
                       bottom_depth: int | None=None,
-                      zoom: int=2) -> go.Figure:
+                      zoom: int=2) -> 'go.Figure':
     """Plot points on a map.
     
     Produces a plot of points on a map, sized according to the 
@@ -138,37 +141,42 @@ def plot_property_map(self,
         the `show()` method to display this graphically in an interactive
         context.
     """
+    import plotly.graph_objects as go
+    
     agg = self \
         .aggregate_means(top_depth, bottom_depth) \
-        .dropna(subset='mean') \
-        .reset_index()
+        .dropna(subset='mean')
 
     property_data = agg \
-        .query(f"soil_property == '{soil_property}'") \
-        .reset_index()
+        .loc[lambda x: x['soil_property'] == soil_property]
     
-    label_order = [soil_property] + sorted(list(set(agg['soil_property'])))
+    # The selected property comes first, then the rest alphabetically. NB, 
+    # mapping to a sort key is much quicker than looking up each row's
+    # position in a list. `unique()` finds the properties without iterating
+    # over every row in Python (for categoricals, it just reads the codes).
+    label_order = {prop: i for i, prop in enumerate(sorted(agg['soil_property'].unique()))}
+    label_order[soil_property] = -1
 
     label_data = agg \
-        .sort_values('soil_property', key=lambda col: col.apply(label_order.index)) \
+        .sort_values('soil_property', key=lambda col: col.astype(str).map(label_order)) \
         .assign(
-            label=lambda x: 
-                x['soil_property'] + 
-                ': ' + 
-                x['mean'].astype(int).astype(str) + 
-                x['mapped_units']
+            # NB, building each label in one go avoids allocating a new 
+            # Series for every piece of the string
+            label=lambda x: [
+                f'<b>{prop}: {mean}{unit}</b>' if prop == soil_property else 
+                f'<i>{prop}: {mean}{unit}</i>'
+                for prop, mean, unit in zip(
+                    x['soil_property'], 
+                    x['mean'].astype(int).tolist(), 
+                    x['mapped_units']
+                )
+            ]
         ) \
-        .assign(
-            label=lambda x: np.where(
-                x['soil_property'] == soil_property, 
-                '<b>' + x['label'] + '</b>', 
-                '<i>' + x['label'] + '</i>'
-            )
-        ) \
-        .groupby(['lat', 'lon']) \
+        .groupby(['lat', 'lon'], sort=False) \
         .agg(dict(label=lambda x: '<br>'.join(x)))
         
-    plot_data = property_data.merge(label_data, how='left', on=['lat', 'lon'])
+    # NB, `label_data` is already indexed by lat/lon, so can be joined directly
+    plot_data = property_data.join(label_data, on=['lat', 'lon'])
 
     trace = go.Scattermapbox(
         lat=plot_data['lat'],
@@ -191,20 +199,18 @@ def plot_property_map(self,
     # the plotted region is.
     expansion_factor = 2
     
+    prop_name = soil_property.capitalize()
+    depth_min, depth_max = agg['top_depth'].min(), agg['bottom_depth'].max()
+    depth_unit = agg['unit_depth'].iloc[0]
+    prop_unit = property_data['mapped_units'].iloc[0]
+    prop_min, prop_max = int(property_data['mean'].min()), int(property_data['mean'].max())
+    
     title = '<br>'.join([
-        '<b>Mean Soil {prop} at {depth_min}-{depth_max}{unit}</b>'.format(
-            prop='Organic Carbon Stock' if soil_property == 'ocs' else soil_property.capitalize(),
-            depth_min=agg['top_depth'].min(), 
-            depth_max=agg['bottom_depth'].max(), 
-            unit=agg['unit_depth'][0]
-        ),
+        f'<b>Mean Soil {"Organic Carbon Stock" if soil_property == "ocs" else prop_name} '
+        f'at {depth_min}-{depth_max}{depth_unit}</b>',
         f'Bounds: lat=[{latmin:.6f}, {latmax:.6f}]; lon=[{lonmin:.6f}, {lonmax:.6f}]',
-        '{prop} range for the region ({unit}): [{prop_min}, {prop_max}]'.format(
-            prop='OCS' if soil_property == 'ocs' else soil_property.capitalize(),
-            unit=property_data['mapped_units'][0],
-            prop_min=int(property_data['mean'].min()), 
-            prop_max=int(property_data['mean'].max())
-        )
+        f'{"OCS" if soil_property == "ocs" else prop_name} range for the region '
+        f'({prop_unit}): [{prop_min}, {prop_max}]'
     ])
     
     layout = go.Layout(
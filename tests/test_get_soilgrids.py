@@ -1,10 +1,73 @@
+import json
+import numpy as np
 import pytest
+import time
 
-from urllib import request
+from urllib import parse, request
 import soilgrids
 
-# NB, get_soilgrids() itself isn't tested as its logic is pretty simple. 
-# The sub-functions it calls are tested below and in other files.
+# NB, get_soilgrids() is tested using a fake session in place of the API, so
+# these tests don't need an internet connection. _query_soilgrids() is 
+# tested against the real API.
+
+
+class FakeResponse:
+    status_code = 200
+    
+    def __init__(self, content):
+        self.content = content
+    
+    def raise_for_status(self):
+        pass
+
+
+class FakeSession:
+    """Gives a response of the same form as Soilgrids for each query, with
+    every value set to the point's `lat`. `delay` optionally gives the time
+    to wait before responding, as a function of `lat`."""
+    
+    def __init__(self, delay=None):
+        self.queries = []
+        self.delay = delay
+    
+    def get(self, url, **kwargs):
+        query = parse.parse_qs(parse.urlsplit(url).query)
+        self.queries.append(query)
+        
+        lat, lon = float(query['lat'][0]), float(query['lon'][0])
+        
+        if self.delay is not None:
+            time.sleep(self.delay(lat))
+        
+        # NB, Soilgrids only returns each property once, however many times
+        # it's requested
+        layers = [
+            {
+                'name': prop,
+                'unit_measure': {'d_factor': 10, 'mapped_units': 'g/kg', 'target_units': '%', 'uncertainty_unit': ''},
+                'depths': [
+                    {
+                        'range': {'top_depth': 0, 'bottom_depth': 5, 'unit_depth': 'cm'}, 
+                        'label': '0-5cm', 
+                        'values': {v: lat for v in query['value']}
+                    }
+                ]
+            }
+            for prop in dict.fromkeys(query['property'])
+        ]
+        
+        return FakeResponse(json.dumps({
+            'type': 'Feature',
+            'geometry': {'type': 'Point', 'coordinates': [lon, lat]},
+            'properties': {'layers': layers}
+        }).encode())
+
+
+@pytest.fixture
+def session(monkeypatch):
+    # No need to wait between fake requests
+    monkeypatch.setattr(soilgrids.api_requests, '_throttle_requests', lambda: None)
+    return FakeSession()
 
 
 def test_query_soilgrids():
@@ -32,4 +95,96 @@ def test_query_soilgrids():
     returned_values = [v for p in resp['properties']['layers'] for d in p['depths'] for v in d['values']]
     assert set(returned_values) == {'mean', 'uncertainty'}, 'Response should include values mean and uncertainty'
     
-    
\ No newline at end of file
+    
+
+def test_get_soilgrids_checks_coords():
+    # NB, these fail before any request is made
+    with pytest.raises(AssertionError) as err:
+        soilgrids.get_soilgrids([10, 95, float('nan')], 0)
+    assert 'Invalid `lat`'           in str(err.value), 'Error message should indicate the invalid argument'
+    assert '[95.0, nan]'             in str(err.value), 'Error message should indicate the invalid values, including NaNs'
+    
+    with pytest.raises(AssertionError) as err:
+        soilgrids.get_soilgrids(0, [-181, 0])
+    assert 'Invalid `lon`'           in str(err.value), 'Error message should indicate the invalid argument'
+
+
+def test_get_soilgrids_sorts_properties(session):
+    # NB, the output shouldn't depend on the order properties are requested in
+    data = soilgrids.get_soilgrids(50, 60, soil_property=['silt', 'sand', 'clay'], session=session)
+    assert list(data['soil_property'].cat.categories) == ['clay', 'sand', 'silt'], 'Property categories should be sorted'
+    
+    sg = soilgrids.SoilGrids()
+    sg.data = data
+    agg = sg.aggregate_means()
+    assert agg['soil_property'].tolist() == ['clay', 'sand', 'silt'], 'Aggregated properties should be in alphabetical order'
+    
+    
+def test_get_soilgrids_duplicate_properties(session):
+    data = soilgrids.get_soilgrids(50, 60, soil_property=['sand', 'sand'], session=session)
+    assert data['soil_property'].tolist() == ['sand'], 'Duplicated properties should only be returned once'
+
+
+def test_get_soilgrids_tuple_args(session):
+    data = soilgrids.get_soilgrids(
+        50, 60, 
+        soil_property=('clay', 'sand'), 
+        depth=('0-5cm',), 
+        value=('mean', 'uncertainty'), 
+        session=session
+    )
+    assert session.queries[0]['property'] == ['clay', 'sand'],        'Tuple properties should be used in the query'
+    assert session.queries[0]['value']    == ['mean', 'uncertainty'], 'Tuple values should be used in the query'
+    assert data['soil_property'].tolist() == ['clay', 'sand'],        'Output should include each requested property'
+
+
+def test_get_soilgrids_preserves_order(monkeypatch):
+    monkeypatch.setattr(soilgrids.api_requests, '_throttle_requests', lambda: None)
+    
+    # NB, earlier points take longer to respond, so responses arrive in reverse
+    session = FakeSession(delay=lambda lat: (4 - lat) * 0.05)
+    data = soilgrids.get_soilgrids([1, 2, 3, 4], 0, soil_property='clay', session=session, max_concurrency=4)
+    
+    assert data['lat'].tolist() == [1, 2, 3, 4], 'Rows should be in the same order as the points requested'
+    assert data['mean'].tolist() == [1, 2, 3, 4], 'Each row should have the values for its own point'
+
+
+def test_get_soilgrids_repeated_points(session):
+    # NB, 1.0000001 is the same as 1 once rounded for the query
+    data = soilgrids.get_soilgrids([1, 2, 1, 1.0000001], 0, soil_property='clay', session=session)
+    
+    assert len(session.queries) == 2,                'Each distinct point should only be queried once'
+    assert data['lat'].tolist() == [1, 2, 1, 1],     'Repeated points should reuse the rows for the first occurrence'
+    assert data['mean'].tolist() == [1, 2, 1, 1],    'Repeated points should reuse the values for the first occurrence'
+
+
+def test_get_soilgrids_empty(session):
+    data = soilgrids.get_soilgrids([], [], value=['mean', 'uncertainty'], session=session)
+    
+    assert len(session.queries) == 0, 'No points should mean no queries'
+    assert len(data) == 0,            'No points should mean no rows'
+    assert data.dtypes.to_dict() == {
+        'lat':              np.float64,
+        'lon':              np.float64,
+        'soil_property':    'category',
+        'd_factor':         np.int16,
+        'mapped_units':     'category',
+        'target_units':     'category',
+        'uncertainty_unit': 'category',
+        'depth':            'category',
+        'top_depth':        np.int16,
+        'bottom_depth':     np.int16,
+        'thickness':        np.int16,
+        'unit_depth':       'category',
+        'mean':             np.float32,
+        'uncertainty':      np.float32
+    }, 'Output should have the same columns and dtypes, even with no data'
+
+
+def test_encode_query():
+    encode_query = soilgrids.api_requests._encode_query
+    
+    assert encode_query(None, None, None) == '', 'No arguments should give an empty query'
+    assert encode_query(('clay', 'sand'), None, ('mean',)) == '&property=clay&property=sand&value=mean', \
+        'Each value should be given as a separate parameter'
+    assert encode_query(None, ('0-5cm',), None) == '&depth=0-5cm', 'Missing arguments should be left out'
@@ -2,26 +2,25 @@ import pandas as pd
 import soilgrids
     
     
-def test_parse_depth():
+def test_depth_row():
     ocs_depth = {
         'range': {'top_depth': 0, 'bottom_depth': 30, 'unit_depth': 'cm'}, 
         'label': '0-30cm', 
         'values': {'mean': 87, 'uncertainty': 10}
     }
 
-    ocs = soilgrids.api_requests._parse_depth(ocs_depth)
+    ocs = soilgrids.api_requests._depth_row(ocs_depth)
     
-    assert type(ocs) == pd.DataFrame,     'Parsed depth should be an instance of pandas.DataFrame'
-    assert len(ocs) == 1,                 'Parsed depth should have one row'
-    assert 'depth'        in ocs.columns, "Parsed depth should have a 'depth' column"
-    assert 'top_depth'    in ocs.columns, "Parsed depth should have a 'top_depth' column"
-    assert 'bottom_depth' in ocs.columns, "Parsed depth should have a 'bottom_depth' column"
-    assert 'unit_depth'   in ocs.columns, "Parsed depth should have a 'unit_depth' column"
-    assert 'mean'         in ocs.columns, "Parsed depth should have a 'mean' column"
-    assert 'uncertainty'  in ocs.columns, "Parsed depth should have a 'uncertainty' column"
+    assert type(ocs) == dict,     'Parsed depth should be a dict giving a single row'
+    assert 'depth'        in ocs, "Parsed depth should have a 'depth' field"
+    assert 'top_depth'    in ocs, "Parsed depth should have a 'top_depth' field"
+    assert 'bottom_depth' in ocs, "Parsed depth should have a 'bottom_depth' field"
+    assert 'unit_depth'   in ocs, "Parsed depth should have a 'unit_depth' field"
+    assert 'mean'         in ocs, "Parsed depth should have a 'mean' field"
+    assert 'uncertainty'  in ocs, "Parsed depth should have a 'uncertainty' field"
 
     
-def test_parse_property():
+def test_property_rows():
     clay_property = {
         'name': 'clay',
         'unit_measure': {'d_factor': 10, 'mapped_units': 'g/kg', 'target_units': '%', 'uncertainty_unit': ''},
@@ -38,24 +37,24 @@ def test_parse_property():
         ] 
     }
 
-    clay = soilgrids.api_requests._parse_property(clay_property)
+    clay = soilgrids.api_requests._property_rows(clay_property)
     
-    assert type(clay) == pd.DataFrame,         'Parsed property should be an instance of pandas.DataFrame'
+    assert type(clay) == list,                 'Parsed property should be a list of rows'
     assert len(clay) == 2,                     'Parsed property should have two rows'
-    assert 'soil_property'    in clay.columns, "Parsed property should have a 'soil_property' column"
-    assert 'd_factor'         in clay.columns, "Parsed property should have a 'd_factor' column"
-    assert 'mapped_units'     in clay.columns, "Parsed property should have a 'mapped_units' column"
-    assert 'target_units'     in clay.columns, "Parsed property should have a 'target_units' column"
-    assert 'uncertainty_unit' in clay.columns, "Parsed property should have a 'uncertainty_unit' column"
-    assert 'depth'            in clay.columns, "Parsed property should have a 'depth' column"
-    assert 'top_depth'        in clay.columns, "Parsed property should have a 'top_depth' column"
-    assert 'bottom_depth'     in clay.columns, "Parsed property should have a 'bottom_depth' column"
-    assert 'unit_depth'       in clay.columns, "Parsed property should have a 'unit_depth' column"
-    assert 'mean'             in clay.columns, "Parsed property should have a 'mean' column"
-    assert 'uncertainty'      in clay.columns, "Parsed property should have a 'uncertainty' column"
+    assert all('soil_property'    in row for row in clay), "Parsed property rows should have a 'soil_property' field"
+    assert all('d_factor'         in row for row in clay), "Parsed property rows should have a 'd_factor' field"
+    assert all('mapped_units'     in row for row in clay), "Parsed property rows should have a 'mapped_units' field"
+    assert all('target_units'     in row for row in clay), "Parsed property rows should have a 'target_units' field"
+    assert all('uncertainty_unit' in row for row in clay), "Parsed property rows should have a 'uncertainty_unit' field"
+    assert all('depth'            in row for row in clay), "Parsed property rows should have a 'depth' field"
+    assert all('top_depth'        in row for row in clay), "Parsed property rows should have a 'top_depth' field"
+    assert all('bottom_depth'     in row for row in clay), "Parsed property rows should have a 'bottom_depth' field"
+    assert all('unit_depth'       in row for row in clay), "Parsed property rows should have a 'unit_depth' field"
+    assert all('mean'             in row for row in clay), "Parsed property rows should have a 'mean' field"
+    assert all('uncertainty'      in row for row in clay), "Parsed property rows should have a 'uncertainty' field"
 
 
-def test_parse_response():
+def test_response_rows():
     response = {
         'type': 'Feature',
         'geometry': {'type': 'Point', 'coordinates': [55.123123, 56.456456]},
@@ -92,9 +91,11 @@ def test_parse_response():
         'query_time_s': 0.8,
     }
 
-    parsed = soilgrids.api_requests._parse_response(response)
+    rows = soilgrids.api_requests._response_rows(response)
     
-    assert type(parsed) == pd.DataFrame, 'Parsed response should be an instance of pandas.DataFrame'
+    assert type(rows) == list, 'Parsed response should be a list of rows'
+    
+    parsed = pd.DataFrame(rows)
     
     # This one's more complex, so it's easiest to just check against the expected output
     expected = pd.DataFrame({
@@ -1,6 +1,7 @@
 import pytest
 
 from soilgrids import SoilGrids
+import numpy as np
 import pandas as pd
 
 
@@ -32,6 +33,28 @@ def test_soilgrids_data():
     
     assert sg.region_bounds == {'lat': (8.663411, 8.680699), 'lon': (56.323929, 56.441106)}, \
         "region_bounds should be {'lat': (8.663411, 8.680699), 'lon': (56.323929, 56.441106)}"
+    
+    assert sg.data['soil_property'].dtype == 'category', 'String columns should be stored as categoricals'
+    assert sg.data['target_units'].dtype == 'category',  'String columns should be stored as categoricals'
+    assert sg.data['top_depth'].dtype == np.int16,       'Depths should be stored as int16'
+    assert sg.data['mean'].dtype == np.float32,          'Values should be stored as float32'
+    
+    # NB, int16 can't hold missing values, so these columns are left as they are
+    missing_depth = sg.data.astype({'top_depth': float})
+    missing_depth.loc[missing_depth.index[0], 'top_depth'] = np.nan
+    sg.data = missing_depth
+    assert sg.data['top_depth'].isna().sum() == 1,       'Missing depths should be kept'
+    assert sg.data['bottom_depth'].dtype == np.int16,    'Complete depths should still be stored as int16'
+    
+    # Rows with missing depths should be left out of any aggregation
+    rows_dropped = SoilGrids()
+    rows_dropped.data = missing_depth.drop(index=missing_depth.index[0])
+    for skipna in [False, True]:
+        pd.testing.assert_series_equal(
+            sg.aggregate_means(skipna=skipna)['mean'], 
+            rows_dropped.aggregate_means(skipna=skipna)['mean'],
+            obj='Aggregated means with missing depths'
+        )
         
     
 def test_rank_properties():
@@ -155,3 +178,49 @@ def test_region_bounds():
     assert sg.region_bounds == {'lat': (8.663411, 8.680699), 'lon': (56.323929, 56.441106)}, \
         "Region bounds should be {'lat': (8.663411, 8.680699), 'lon': (56.323929, 56.441106)}"
         
+
+
+def test_weight_by_thickness():
+    from soilgrids.soilgrids._data_ops import _weight_by_thickness
+    
+    weighted = _weight_by_thickness(
+        mean=np.array([9.0, 12.0, 60.0]),
+        thickness=np.array([5.0, 10.0, 30.0]),
+        group_ids=np.array([0, 0, 1])
+    )
+    
+    assert list(weighted) == [3.0, 8.0, 60.0], \
+        'Each mean should be weighted by its share of the total group thickness'
+
+
+def test_aggregate_means_cache():
+    sg = SoilGrids()
+    data = pd.read_csv('tests/data/soilgrids-results.csv')
+    sg.data = data
+    
+    agg = sg.aggregate_means(0, 30)
+    agg['mean'] = 0
+    
+    assert (sg.aggregate_means(0, 30)['mean'] > 0).any(), \
+        'Modifying the output of aggregate_means() should not affect the cache'
+    
+    sg.data = data.assign(mean=1)
+    assert (sg.aggregate_means(0, 30)['mean'] <= 1).all(), \
+        'Setting data should clear the aggregate_means() cache'
+
+
+
+def test_aggregate_means_missing_depth():
+    data = pd.read_csv('tests/data/soilgrids-results.csv')
+    missing = data.index[data['soil_property'] == 'sand'][0]
+    
+    sg = SoilGrids()
+    sg.data = data.drop(index=missing)
+    expected = {skipna: sg.aggregate_means(skipna=skipna) for skipna in [False, True]}
+    
+    sg.data = data.assign(top_depth=data['top_depth'].where(data.index != missing))
+    for skipna in [False, True]:
+        pd.testing.assert_series_equal(
+            sg.aggregate_means(skipna=skipna)['mean'], expected[skipna]['mean'],
+            obj='Rows with missing depths should be dropped before aggregating'
+        )
@@ -1,6 +1,10 @@
 import pytest
+import sys
+import threading
+import time
 
-from soilgrids._utils import _check_arg, _rscript, _find_rscript_binary, _to_vector, _pkg_file
+import soilgrids._utils
+from soilgrids._utils import _check_arg, _rscript, _find_rscript_binary, _to_vector, _pkg_file, _ResponseCache, _r_worker, _RWorker, _rescale, _Throttle
 import numpy as np
 import pandas as pd
 
@@ -48,6 +52,7 @@ def test_to_vector():
     assert _to_vector(series) is series, 'Pandas Series should be unchanged'
     assert _to_vector('a')   == ['a'],   'Scalar should be converted to list'
     assert _to_vector(['a']) == ['a'],   'List should be unchanged'
+    assert _to_vector(('a',)) == ('a',), 'Tuple should be unchanged'
     assert _to_vector('abc') == ['abc'], 'String should be converted to list'
     assert _to_vector(1)     == [1],     'Integer should be converted to list'
     assert _to_vector(1.0)   == [1.0],   'Float should be converted to list'
@@ -70,4 +75,92 @@ def test_pkg_file():
     with pytest.raises(FileNotFoundError) as err:
         _pkg_file('bananas.txt')
     assert 'bananas.txt' in str(err.value), \
-        "_pkg_file() should raise an informative error if the file doesn't exist"
\ No newline at end of file
+        "_pkg_file() should raise an informative error if the file doesn't exist"
+
+def test_response_cache(tmp_path):
+    cache = _ResponseCache(tmp_path / 'cache')
+    key = {'lat': '1.000000', 'lon': '2.000000', 'value': ['mean']}
+    
+    assert cache.get(key) is None, 'Uncached keys should give `None`'
+    
+    cache.set(key, {'a': [1, 2, 3]})
+    assert cache.get(key) == {'a': [1, 2, 3]}, 'Cached values should be returned'
+    assert cache.get({**key, 'lat': '1.000001'}) is None, 'Keys should not be confused'
+    
+    cache.max_age = -1
+    assert cache.get(key) is None, 'Expired values should not be returned'
+
+
+def test_r_worker():
+    try:
+        _find_rscript_binary()
+    except FileNotFoundError:
+        pytest.skip('No R installation available')
+    
+    assert _r_worker('r-scripts/eval-parse.R', 'cat(1 + 1)') == '2', \
+        'R worker should return the console output of the expression'
+    
+    with pytest.raises(RuntimeError) as err:
+        _r_worker('r-scripts/eval-parse.R', 'stop("Oh no!")') 
+    
+    assert 'Oh no!' in str(err.value), \
+        "Error message should indicate the error returned by R"
+        
+    assert _r_worker('r-scripts/eval-parse.R', 'cat(2 + 2)') == '4', \
+        'R worker should keep working after an error'
+
+
+def test_r_worker_reports_crash(monkeypatch):
+    # NB, Python can't run the worker script, so exits straight away with a
+    # SyntaxError. This stands in for R failing to start.
+    monkeypatch.setattr(soilgrids._utils, '_find_rscript_binary', lambda: sys.executable)
+    worker = _RWorker()
+    
+    with pytest.raises(RuntimeError) as err:
+        worker('r-scripts/eval-parse.R', 'cat(1 + 1)')
+    
+    assert 'exited unexpectedly' in str(err.value), 'Error message should indicate the worker died'
+    assert 'SyntaxError'         in str(err.value), "Error message should include the worker's stderr"
+
+
+def test_rescale():
+    assert np.allclose(_rescale(np.array([1, 2, 3]), 10, 20), [10, 15, 20]), \
+        'Values should be rescaled to the given range'
+    assert np.allclose(_rescale(np.array([4, 4], dtype=np.int16), 10, 20), [10, 10]), \
+        'Constant input should map to the lower bound rather than NaN'
+    
+    x = _rescale(np.random.default_rng(1).normal(size=1000) * 1e6, 10, 20)
+    assert x.min() >= 10 and x.max() <= 20, \
+        'Rescaled values should never fall outside the given range'
+
+
+def test_throttle_threads():
+    throttle = _Throttle(0.05)
+    times = []
+    
+    def call():
+        throttle()
+        times.append(time.monotonic())
+    
+    threads = [threading.Thread(target=call) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    
+    gaps = np.diff(sorted(times))
+    assert (gaps >= 0.045).all(), \
+        'Calls from different threads should still be spaced by the interval'
+
+
+def test_throttle_burst():
+    throttle = _Throttle(0.05, burst=3)
+    start = time.monotonic()
+    for _ in range(3):
+        throttle()
+    assert time.monotonic() - start < 0.05, \
+        'Calls up to the burst size should not have to wait'
+    
+    throttle()
+    assert time.monotonic() - start >= 0.14, \
+        'Calls beyond the burst size should wait for the window to pass'